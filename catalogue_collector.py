@@ -5,8 +5,9 @@
 __version__ = '1.2.1'
 __author__ = 'Vitali Stupin'
 
-import queue
-from threading import Thread, Event, Lock
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from operator import itemgetter
 from datetime import datetime, timedelta
 from io import BytesIO
 import argparse
@@ -15,13 +16,16 @@ import json
 import logging.config
 import os
 import re
-import shutil
 import sys
 import time
 import urllib.parse as urlparse
+import orjson
+import requests
 import urllib3
 from minio import Minio
+from minio.deleteobjects import DeleteObject
 from minio.error import S3Error
+from requests.adapters import HTTPAdapter
 import xrdinfo
 
 # TODO: Refactor to use os.path.join instead of '{}{}' and '{}/{}' for path joining
@@ -43,6 +47,48 @@ DEFAULT_WSDL_REPLACES = [
     # ]
 ]
 
+# Amount of threads used for hashing of stored documents
+DEFAULT_HASH_THREAD_COUNT = 4
+
+# Size of chunks used when hashing stored documents
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Names of hash cache files of stored documents. Name must be changed
+# together with hashing algorithm to avoid comparing incompatible hashes.
+HASHES_FILES = {
+    'wsdl': '_wsdl_blake2b_hashes',
+    'openapi': '_openapi_blake2b_hashes'
+}
+
+# Positive number options that are used without conversion
+POSITIVE_CONFIG_PARAMS = (
+    'filtered_hours', 'filtered_days', 'filtered_months', 'cleanup_interval', 'days_to_keep')
+
+# File names of WSDL documents stored by collector
+WSDL_NAME_RE = re.compile('^(\\d+)\\.wsdl$')
+
+# File names of OpenAPI documents stored by collector
+OPENAPI_NAME_RE = re.compile('^(.+)_(\\d+)\\.(yaml|json)$')
+
+# Hash cache files of older collector versions. They are not used any
+# more and are removed during cleanup together with unused documents.
+LEGACY_HASHES_FILES = frozenset(('_wsdl_hashes', '_openapi_hashes'))
+
+# File names of all stored documents
+ANY_DOC_NAME_RE = re.compile('^(?:\\d+\\.wsdl|.+_\\d+\\.(?:yaml|json))$')
+
+# File names of stored documents by document type
+DOC_NAME_RES = {
+    'wsdl': WSDL_NAME_RE,
+    'openapi': OPENAPI_NAME_RE
+}
+
+# File names of reports
+REPORT_NAME_RE = re.compile('^index_(\\d{4})(\\d{2})(\\d{2})(\\d{2})(\\d{2})(\\d{2})\\.json$')
+
+# Sort key of reports and history items
+REPORT_TIME_KEY = itemgetter('reportTime')
+
 # This logger will be used before loading of logger configuration
 DEFAULT_LOGGER = {
     'version': 1,
@@ -106,6 +152,27 @@ def configure_logging(config):
         LOGGER.info('Logger configured')
 
 
+def fuse_wsdl_replaces(wsdl_replaces):
+    """Combine compiled WSDL replaces into a single pattern, so that WSDL
+    is processed in one pass. Replaces are returned unchanged when
+    patterns use groups or flags, or replacements use escapes.
+    """
+    if len(wsdl_replaces) < 2:
+        return wsdl_replaces
+    for pattern, replacement in wsdl_replaces:
+        if pattern.groups or pattern.flags != re.UNICODE or '\\' in replacement:
+            return wsdl_replaces
+    try:
+        fused_pattern = re.compile('|'.join(
+            '(?P<r{}>{})'.format(nr, pattern.pattern)
+            for nr, (pattern, _) in enumerate(wsdl_replaces)))
+    except re.error:
+        return wsdl_replaces
+    replacements = {
+        'r{}'.format(nr): replacement for nr, (_, replacement) in enumerate(wsdl_replaces)}
+    return [(fused_pattern, lambda match: replacements[match.lastgroup])]
+
+
 def set_params(config):
     """Configure parameters based on loaded configuration"""
     params = {
@@ -125,6 +192,7 @@ def set_params(config):
         'cert': None,
         'thread_cnt': DEFAULT_THREAD_COUNT,
         'wsdl_replaces': DEFAULT_WSDL_REPLACES,
+        'fuse_wsdl_replaces': False,
         'excluded_member_codes': [],
         'excluded_subsystem_codes': [],
         'filtered_hours': 24,
@@ -132,10 +200,9 @@ def set_params(config):
         'filtered_months': 12,
         'cleanup_interval': 7,
         'days_to_keep': 30,
-        'work_queue': queue.Queue(),
-        'results': {},
-        'results_lock': Lock(),
-        'shutdown': Event()
+        'hash_thread_cnt': DEFAULT_HASH_THREAD_COUNT,
+        'hash_pool': None,
+        'hashes_cache': {}
     }
 
     if 'output_path' in config:
@@ -167,10 +234,16 @@ def set_params(config):
         LOGGER.info('Configuring "minio_bucket": %s', params['minio_bucket'])
 
     if 'minio_path' in config:
-        params['minio_path'] = config['minio_path']
-        params['minio_path'].strip('/')
+        params['minio_path'] = config['minio_path'].strip('/')
         if params['minio_path']:
             params['minio_path'] += '/'
+        if config['minio_path'] and params['minio_path'] != '{}/'.format(config['minio_path']):
+            # Older versions did not strip slashes and used keys like
+            # "path//index.json"
+            LOGGER.warning(
+                'Leading and trailing slashes were removed from "minio_path". Objects saved '
+                'by older versions with prefix "%s/" must be moved to prefix "%s"',
+                config['minio_path'], params['minio_path'])
         LOGGER.info('Configuring "minio_path": %s', params['minio_path'])
 
     if params['path'] is None and params['minio'] is None:
@@ -214,10 +287,31 @@ def set_params(config):
         params['thread_cnt'] = config['thread_count']
         LOGGER.info('Configuring "thread_cnt": %s', params['thread_cnt'])
 
+    if 'hash_thread_count' in config and config['hash_thread_count'] > 0:
+        params['hash_thread_cnt'] = config['hash_thread_count']
+        LOGGER.info('Configuring "hash_thread_cnt": %s', params['hash_thread_cnt'])
+
     if 'wsdl_replaces' in config:
         params['wsdl_replaces'] = config['wsdl_replaces']
         LOGGER.info('Configuring "wsdl_replaces": %s', params['wsdl_replaces'])
 
+    if 'fuse_wsdl_replaces' in config:
+        params['fuse_wsdl_replaces'] = config['fuse_wsdl_replaces']
+        LOGGER.info('Configuring "fuse_wsdl_replaces": %s', params['fuse_wsdl_replaces'])
+
+    try:
+        # Compiling patterns once instead of doing that for every WSDL
+        params['wsdl_replaces'] = [
+            (re.compile(pattern), replacement)
+            for pattern, replacement in params['wsdl_replaces']]
+    except (re.error, TypeError, ValueError) as err:
+        LOGGER.error('Configuration error: Incorrect "wsdl_replaces": %s', err)
+        return None
+    if params['fuse_wsdl_replaces']:
+        # Single pass gives different results when a pattern matches
+        # text produced by another replacement, therefore it is optional
+        params['wsdl_replaces'] = fuse_wsdl_replaces(params['wsdl_replaces'])
+
     if 'excluded_member_codes' in config:
         params['excluded_member_codes'] = config['excluded_member_codes']
         LOGGER.info('Configuring "excluded_member_codes": %s', params['excluded_member_codes'])
@@ -227,25 +321,20 @@ def set_params(config):
         LOGGER.info(
             'Configuring "excluded_subsystem_codes": %s', params['excluded_subsystem_codes'])
 
-    if 'filtered_hours' in config and config['filtered_hours'] > 0:
-        params['filtered_hours'] = config['filtered_hours']
-        LOGGER.info('Configuring "filtered_hours": %s', params['filtered_hours'])
-
-    if 'filtered_days' in config and config['filtered_days'] > 0:
-        params['filtered_days'] = config['filtered_days']
-        LOGGER.info('Configuring "filtered_days": %s', params['filtered_days'])
-
-    if 'filtered_months' in config and config['filtered_months'] > 0:
-        params['filtered_months'] = config['filtered_months']
-        LOGGER.info('Configuring "filtered_months": %s', params['filtered_months'])
-
-    if 'cleanup_interval' in config and config['cleanup_interval'] > 0:
-        params['cleanup_interval'] = config['cleanup_interval']
-        LOGGER.info('Configuring "cleanup_interval": %s', params['cleanup_interval'])
+    try:
+        # Sets allow constant time lookups of excluded subsystems
+        params['excluded_member_codes'] = frozenset(params['excluded_member_codes'])
+        params['excluded_subsystem_codes'] = frozenset(
+            (member_code, subsystem_code)
+            for member_code, subsystem_code in params['excluded_subsystem_codes'])
+    except (TypeError, ValueError) as err:
+        LOGGER.error('Configuration error: Incorrect excluded codes: %s', err)
+        return None
 
-    if 'days_to_keep' in config and config['days_to_keep'] > 0:
-        params['days_to_keep'] = config['days_to_keep']
-        LOGGER.info('Configuring "days_to_keep": %s', params['days_to_keep'])
+    for name in POSITIVE_CONFIG_PARAMS:
+        if name in config and config[name] > 0:
+            params[name] = config[name]
+            LOGGER.info('Configuring "%s": %s', name, params[name])
 
     if params['path'] is not None and params['minio'] is not None:
         LOGGER.warning('Saving to both local and MinIO storage is not supported')
@@ -262,22 +351,35 @@ def set_params(config):
 
 def prepare_minio_client(params):
     """Creates minio client and stores that in params"""
-    if params['minio_ca_certs']:
-        http_client = urllib3.PoolManager(
-            ca_certs=params['minio_ca_certs']
-        )
-        params['minio_client'] = Minio(
-            params['minio'],
-            access_key=params['minio_access_key'],
-            secret_key=params['minio_secret_key'],
-            secure=params['minio_secure'],
-            http_client=http_client)
-    else:
-        params['minio_client'] = Minio(
-            params['minio'],
-            access_key=params['minio_access_key'],
-            secret_key=params['minio_secret_key'],
-            secure=params['minio_secure'])
+    # Same settings as MinIO defaults, but connection pool is large
+    # enough for all subsystem, service and hashing threads to keep their
+    # connections
+    timeout = timedelta(minutes=5).seconds
+    http_client = urllib3.PoolManager(
+        timeout=urllib3.util.Timeout(connect=timeout, read=timeout),
+        maxsize=2 * params['thread_cnt'] + params['hash_thread_cnt'],
+        cert_reqs='CERT_REQUIRED',
+        ca_certs=params['minio_ca_certs'] or os.environ.get(
+            'SSL_CERT_FILE') or requests.certs.where(),
+        retries=urllib3.Retry(total=5, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]))
+    params['minio_client'] = Minio(
+        params['minio'],
+        access_key=params['minio_access_key'],
+        secret_key=params['minio_secret_key'],
+        secure=params['minio_secure'],
+        http_client=http_client)
+
+
+def prepare_http_session(params):
+    """Creates HTTP session for Security Server requests and stores that
+    in params. Session keeps connections open between requests.
+    """
+    # All requests go to the same Security Server, each worker thread
+    # uses one connection for SOAP and one for REST requests
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2 * params['thread_cnt'])
+    params['session'] = requests.Session()
+    params['session'].mount('http://', adapter)
+    params['session'].mount('https://', adapter)
 
 
 def make_dirs(path):
@@ -292,158 +394,248 @@ def make_dirs(path):
     return True
 
 
-def hash_wsdls(path, params):
-    """Find hashes of all WSDL's in directory"""
-    hashes = {}
+def doc_hasher(data=b''):
+    """Create hash object used for detection of duplicate documents.
+    Hash is not used for security purposes, therefore faster BLAKE2 is
+    used instead of MD5.
+    """
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def hash_file(file_name):
+    """Find hash of a file without reading the whole file into memory"""
+    # Reading as bytes to avoid line ending conversion. File is read in
+    # large chunks, therefore additional buffering is not needed.
+    with open(file_name, 'rb', buffering=0) as doc_file:
+        if hasattr(os, 'posix_fadvise'):
+            # File is read once from start to end
+            os.posix_fadvise(doc_file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if hasattr(hashlib, 'file_digest'):
+            # Available since Python 3.11
+            file_hash = hashlib.file_digest(doc_file, doc_hasher)
+        else:
+            # Reusing single buffer instead of allocating bytes per chunk
+            file_hash = doc_hasher()
+            buffer = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buffer)
+            size = doc_file.readinto(buffer)
+            while size:
+                file_hash.update(view[:size])
+                size = doc_file.readinto(buffer)
+        if hasattr(os, 'posix_fadvise'):
+            # File is not needed in page cache after hashing
+            os.posix_fadvise(doc_file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    return file_hash.hexdigest()
+
+
+def hash_local_files(path, name_re, params):
+    """Find hashes of local files with names matching the regex"""
+    file_names = []
+    file_paths = []
+    # DirEntry caches file type from directory listing
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if name_re.match(entry.name) and entry.is_file(follow_symlinks=False):
+                file_names.append(entry.name)
+                file_paths.append(entry.path)
+    # Hashing files in parallel, hashlib releases GIL while hashing
+    return dict(zip(file_names, params['hash_pool'].map(hash_file, file_paths)))
+
+
+def read_minio_object(object_name, params):
+    """Read the whole MinIO object and return connection to the pool"""
+    response = params['minio_client'].get_object(params['minio_bucket'], object_name)
+    try:
+        return response.data
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def hash_minio_object(object_name, params):
+    """Find hash of a MinIO object"""
+    doc_object = params['minio_client'].get_object(params['minio_bucket'], object_name)
+    try:
+        # Hashing in chunks without reading the whole object into memory
+        doc_hash = doc_hasher()
+        for chunk in doc_object.stream(HASH_CHUNK_SIZE):
+            doc_hash.update(chunk)
+    finally:
+        doc_object.close()
+        doc_object.release_conn()
+    return doc_hash.hexdigest()
+
+
+def hash_minio_objects(path, name_re, params):
+    """Find hashes of MinIO objects with names matching the regex"""
+    file_names = []
+    object_names = []
+    path_len = len(path)
+    for obj in params['minio_client'].list_objects(
+            params['minio_bucket'], prefix=path, recursive=False):
+        file_name = obj.object_name[path_len:]
+        if name_re.match(file_name):
+            file_names.append(file_name)
+            object_names.append(obj.object_name)
+    # Downloading objects in parallel, requests are network bound
+    return dict(zip(file_names, params['hash_pool'].map(
+        hash_minio_object, object_names, repeat(params))))
+
+
+def hash_docs(path, doc_type, params):
+    """Find hashes of all documents of a type in directory"""
     if params['minio']:
-        for obj in params['minio_client'].list_objects(
-                params['minio_bucket'], prefix=path, recursive=False):
-            file_name = obj.object_name[len(path):]
-            search_res = re.search('^(\\d+)\\.wsdl$', file_name)
-            if search_res:
-                wsdl_object = params['minio_client'].get_object(
-                    params['minio_bucket'], '{}{}'.format(path, file_name))
-                hashes[file_name] = hashlib.md5(wsdl_object.data).hexdigest()
-    else:
-        for file_name in os.listdir(path):
-            search_res = re.search('^(\\d+)\\.wsdl$', file_name)
-            if search_res:
-                # Reading as bytes to avoid line ending conversion
-                with open('{}/{}'.format(path, file_name), 'rb') as wsdl_file:
-                    wsdl = wsdl_file.read()
-                hashes[file_name] = hashlib.md5(wsdl).hexdigest()
+        return hash_minio_objects(path, DOC_NAME_RES[doc_type], params)
+    return hash_local_files(path, DOC_NAME_RES[doc_type], params)
+
+
+def read_local_hashes(file_name, params):
+    """Read local hashes file. Hashes read or written earlier by this
+    process are reused while the file is not modified.
+    """
+    mtime = os.stat(file_name).st_mtime_ns
+    # Same file may be referenced by differently formatted paths
+    cache_key = os.path.normpath(file_name)
+    cached = params['hashes_cache'].get(cache_key)
+    if cached is not None and cached[0] == mtime:
+        # Returning a copy, callers may modify hashes
+        return dict(cached[1])
+    with open(file_name, 'rb') as json_file:
+        hashes = orjson.loads(json_file.read())
+    params['hashes_cache'][cache_key] = (mtime, dict(hashes))
     return hashes
 
 
-def get_wsdl_hashes(path, params):
-    """Get WSDL hashes in a directory"""
+def get_hashes(path, doc_type, params):
+    """Get hashes of documents of a type in a directory"""
     if params['minio']:
+        object_name = '{}{}'.format(path, HASHES_FILES[doc_type])
+        # Collector is the only writer of MinIO hashes, therefore hashes
+        # read or written earlier by this process are still valid
+        cached = params['hashes_cache'].get(object_name)
+        if cached is not None:
+            # Returning a copy, callers may modify hashes
+            return dict(cached)
         try:
-            wsdl_hashes_file = params['minio_client'].get_object(
-                params['minio_bucket'], '{}_wsdl_hashes'.format(path))
-            hashes = json.loads(wsdl_hashes_file.data.decode('utf-8'))
-        except S3Error:
-            hashes = hash_wsdls(path, params)
+            hashes = orjson.loads(read_minio_object(object_name, params))
+            params['hashes_cache'][object_name] = dict(hashes)
+        # Rebuilding missing or corrupted hashes cache
+        except (S3Error, ValueError):
+            hashes = hash_docs(path, doc_type, params)
     else:
         try:
-            with open('{}/_wsdl_hashes'.format(params['path']), 'r') as json_file:
-                hashes = json.load(json_file)
-        except IOError:
-            hashes = hash_wsdls(path, params)
+            hashes = read_local_hashes(os.path.join(path, HASHES_FILES[doc_type]), params)
+        except (IOError, ValueError):
+            hashes = hash_docs(path, doc_type, params)
     return hashes
 
 
-def save_wsdl(path, hashes, wsdl, wsdl_replaces, params):
-    """Save WSDL if it does not exist yet"""
+def wsdl_index(hashes):
+    """Build lookup index for WSDL hashes.
+    Return dict: {'hashes': {file_name: hash}, 'files': {hash: file_name},
+    'max': largest WSDL index}.
+    """
+    index = {'hashes': hashes, 'files': {}, 'max': -1}
+    for file_name, wsdl_hash in hashes.items():
+        search_res = WSDL_NAME_RE.match(file_name)
+        if search_res:
+            index['files'].setdefault(wsdl_hash, file_name)
+            if int(search_res.group(1)) > index['max']:
+                index['max'] = int(search_res.group(1))
+    return index
+
+
+def save_wsdl(path, index, wsdl, wsdl_replaces, params):
+    """Save WSDL if it does not exist yet. WSDL index is updated with
+    the new file.
+    """
     # Replacing dynamically generated comments in WSDL to avoid new WSDL
     # creation because of comments.
-    for wsdl_replace in wsdl_replaces:
-        wsdl = re.sub(wsdl_replace[0], wsdl_replace[1], wsdl)
-    wsdl_hash = hashlib.md5(wsdl.encode('utf-8')).hexdigest()
-    max_wsdl = -1
-    for file_name in hashes.keys():
-        if wsdl_hash == hashes[file_name]:
-            # Matching WSDL found
-            return file_name, hashes
-        search_res = re.search('^(\\d+)\\.wsdl$', file_name)
-        if search_res:
-            if int(search_res.group(1)) > max_wsdl:
-                max_wsdl = int(search_res.group(1))
-    # Creating new file
-    new_file = '{}.wsdl'.format(int(max_wsdl) + 1)
+    for pattern, replacement in wsdl_replaces:
+        wsdl = pattern.sub(replacement, wsdl)
+    # Encoding once for both hashing and saving
     wsdl_binary = wsdl.encode('utf-8')
+    wsdl_hash = doc_hasher(wsdl_binary).hexdigest()
+    if wsdl_hash in index['files']:
+        # Matching WSDL found
+        return index['files'][wsdl_hash]
+    # Creating new file
+    new_file = '{}.wsdl'.format(index['max'] + 1)
     if params['minio']:
         params['minio_client'].put_object(
-            params['minio_bucket'], '{}{}'.format(path, new_file),
+            params['minio_bucket'], os.path.join(path, new_file),
             BytesIO(wsdl_binary), len(wsdl_binary), content_type='text/xml')
     else:
         # Writing as bytes to avoid line ending conversion
-        with open('{}/{}'.format(path, new_file), 'wb') as wsdl_file:
+        with open(os.path.join(path, new_file), 'wb') as wsdl_file:
             wsdl_file.write(wsdl_binary)
-    hashes[new_file] = wsdl_hash
-    return new_file, hashes
+    index['max'] += 1
+    index['hashes'][new_file] = wsdl_hash
+    index['files'][wsdl_hash] = new_file
+    return new_file
 
 
-def hash_openapis(path, params):
-    """Find hashes of all OpenAPI documents in directory"""
-    hashes = {}
-    if params['minio']:
-        for obj in params['minio_client'].list_objects(
-                params['minio_bucket'], prefix=path, recursive=False):
-            file_name = obj.object_name[len(path):]
-            search_res = re.search('^.+_(\\d+)\\.(yaml|json)$', file_name)
-            if search_res:
-                openapi_object = params['minio_client'].get_object(
-                    params['minio_bucket'], '{}{}'.format(path, file_name))
-                hashes[file_name] = hashlib.md5(openapi_object.data).hexdigest()
-    else:
-        for file_name in os.listdir(path):
-            search_res = re.search('^.+_(\\d+)\\.(yaml|json)$', file_name)
-            if search_res:
-                # Reading as bytes to avoid line ending conversion
-                with open('{}/{}'.format(path, file_name), 'rb') as openapi_file:
-                    openapi = openapi_file.read()
-                hashes[file_name] = hashlib.md5(openapi).hexdigest()
-    return hashes
-
-
-def get_openapi_hashes(path, params):
-    """Get OpenAPI hashes in a directory"""
-    if params['minio']:
-        try:
-            openapi_hashes_file = params['minio_client'].get_object(
-                params['minio_bucket'], '{}_openapi_hashes'.format(path))
-            hashes = json.loads(openapi_hashes_file.data.decode('utf-8'))
-        except S3Error:
-            hashes = hash_openapis(path, params)
-    else:
-        try:
-            with open('{}/_openapi_hashes'.format(params['path']), 'r') as json_file:
-                hashes = json.load(json_file)
-        except IOError:
-            hashes = hash_openapis(path, params)
-    return hashes
+def openapi_index(hashes):
+    """Build lookup index for OpenAPI hashes.
+    Return dict: {'hashes': {file_name: hash},
+    'files': {(service_name, hash): file_name},
+    'max': {service_name: largest OpenAPI index}}.
+    """
+    index = {'hashes': hashes, 'files': {}, 'max': {}}
+    for file_name, openapi_hash in hashes.items():
+        search_res = OPENAPI_NAME_RE.match(file_name)
+        if search_res:
+            service_name = search_res.group(1)
+            index['files'].setdefault((service_name, openapi_hash), file_name)
+            if int(search_res.group(2)) > index['max'].get(service_name, -1):
+                index['max'][service_name] = int(search_res.group(2))
+    return index
 
 
-def save_openapi(path, hashes, openapi, service_name, doc_type, params):
-    """Save OpenAPI if it does not exist yet"""
-    openapi_hash = hashlib.md5(openapi.encode('utf-8')).hexdigest()
-    max_openapi = -1
-    for file_name in hashes.keys():
-        search_res = re.search('^{}_(\\d+)\\.(yaml|json)$'.format(service_name), file_name)
-        if search_res:
-            if openapi_hash == hashes[file_name]:
-                # Matching OpenAPI found (both name pattern and hash)
-                return file_name, hashes
-            if int(search_res.group(1)) > max_openapi:
-                max_openapi = int(search_res.group(1))
-    # Creating new file
-    new_file = '{}_{}.{}'.format(service_name, int(max_openapi) + 1, doc_type)
+def save_openapi(path, index, openapi, service_name, doc_type, params):
+    """Save OpenAPI if it does not exist yet. OpenAPI index is updated
+    with the new file.
+    """
     openapi_binary = openapi.encode('utf-8')
+    openapi_hash = doc_hasher(openapi_binary).hexdigest()
+    if (service_name, openapi_hash) in index['files']:
+        # Matching OpenAPI found (both name pattern and hash)
+        return index['files'][(service_name, openapi_hash)]
+    # Creating new file
+    max_openapi = index['max'].get(service_name, -1) + 1
+    new_file = '{}_{}.{}'.format(service_name, max_openapi, doc_type)
     content_type = 'text/yaml'
     if doc_type == 'json':
         content_type = 'application/json'
     if params['minio']:
         params['minio_client'].put_object(
-            params['minio_bucket'], '{}{}'.format(path, new_file),
+            params['minio_bucket'], os.path.join(path, new_file),
             BytesIO(openapi_binary), len(openapi_binary), content_type=content_type)
     else:
         # Writing as bytes to avoid line ending conversion
-        with open('{}/{}'.format(path, new_file), 'wb') as openapi_file:
-            openapi_file.write(openapi.encode('utf-8'))
-    hashes[new_file] = openapi_hash
-    return new_file, hashes
+        with open(os.path.join(path, new_file), 'wb') as openapi_file:
+            openapi_file.write(openapi_binary)
+    index['max'][service_name] = max_openapi
+    index['hashes'][new_file] = openapi_hash
+    index['files'][(service_name, openapi_hash)] = new_file
+    return new_file
 
 
 def save_hashes(path, hashes, file_type, params):
     """Save hashes of WSDL/OpenAPI documents (to speedup MinIO)"""
     if params['minio']:
-        hashes_binary = json.dumps(hashes, indent=2, ensure_ascii=False).encode()
+        # Hashes are only read by collector
+        hashes_binary = orjson.dumps(hashes)
+        object_name = '{}{}'.format(path, HASHES_FILES[file_type])
         params['minio_client'].put_object(
-            params['minio_bucket'], '{}_{}_hashes'.format(path, file_type),
+            params['minio_bucket'], object_name,
             BytesIO(hashes_binary), len(hashes_binary), content_type='text/plain')
+        params['hashes_cache'][object_name] = dict(hashes)
     else:
-        write_json('{}/_{}_hashes'.format(path, file_type), hashes, params)
+        file_name = '{}/{}'.format(path, HASHES_FILES[file_type])
+        write_json(file_name, hashes, params, indent=False)
+        params['hashes_cache'][os.path.normpath(file_name)] = (
+            os.stat(file_name).st_mtime_ns, dict(hashes))
 
 
 def method_item(method, status, wsdl):
@@ -481,8 +673,9 @@ def subsystem_item(subsystem, methods, services):
     sorted_methods = []
     if methods is not None:
         subsystem_status = 'OK'
-        for method_key in sorted(methods.keys()):
-            sorted_methods.append(methods[method_key])
+        # Method identifiers are unique tuples, therefore method items
+        # themselves are never compared
+        sorted_methods = [method for _, method in sorted(methods.items())]
 
     return {
         'xRoadInstance': subsystem[0],
@@ -504,83 +697,91 @@ def process_methods(subsystem, params, doc_path):
     try:
         if not params['minio']:
             make_dirs(wsdl_path)
-        hashes = get_wsdl_hashes(wsdl_path, params)
+        index = wsdl_index(get_hashes(wsdl_path, 'wsdl', params))
     except OSError as err:
-        LOGGER.warning('SOAP: %s: %s', identifier_path(subsystem), err)
+        LOGGER.warning('SOAP: %s: %s', doc_path, err)
         return None
 
     method_index = {}
     skip_methods = False
+    # Avoid building WSDL log messages that would be discarded
+    log_info = LOGGER.isEnabledFor(logging.INFO)
     try:
-        # Converting iterator to list to properly capture exceptions
-        methods = list(xrdinfo.methods(
+        # Consuming iterator inside try to properly capture exceptions.
+        # Duplicates are dropped before sorting. Order is kept stable,
+        # because it determines which WSDL is requested first.
+        methods = sorted(set(xrdinfo.methods(
             addr=params['url'], client=params['client'], producer=subsystem,
             method='listMethods', timeout=params['timeout'], verify=params['verify'],
-            cert=params['cert']))
+            cert=params['cert'], session=params['session'])))
     except xrdinfo.XrdInfoError as err:
-        LOGGER.info('SOAP: %s: %s', identifier_path(subsystem), err)
+        LOGGER.info('SOAP: %s: %s', doc_path, err)
         return None
 
-    for method in sorted(methods):
-        method_name = identifier_path(method)
-        if method_name in method_index:
+    for method in methods:
+        if method in method_index:
             # Method already found in previous WSDL's
             continue
 
         if skip_methods:
             # Skipping, because previous getWsdl request timed out
-            LOGGER.info('SOAP: %s - SKIPPING', method_name)
-            method_index[method_name] = method_item(method, 'SKIPPED', '')
+            LOGGER.info('SOAP: %s - SKIPPING', identifier_path(method))
+            method_index[method] = method_item(method, 'SKIPPED', '')
             continue
 
         try:
             wsdl = xrdinfo.wsdl(
                 addr=params['url'], client=params['client'], service=method,
-                timeout=params['timeout'], verify=params['verify'], cert=params['cert'])
+                timeout=params['timeout'], verify=params['verify'], cert=params['cert'],
+                session=params['session'])
         except xrdinfo.RequestTimeoutError:
             # Skipping all following requests to that subsystem
             skip_methods = True
-            LOGGER.info('SOAP: %s - TIMEOUT', method_name)
-            method_index[method_name] = method_item(method, 'TIMEOUT', '')
+            LOGGER.info('SOAP: %s - TIMEOUT', identifier_path(method))
+            method_index[method] = method_item(method, 'TIMEOUT', '')
             continue
         except xrdinfo.XrdInfoError as err:
             if str(err) == 'SoapFault: Service is a REST service and does not have a WSDL':
                 # This is specific to X-Road 6.21 (partial and
                 # deprecated support for REST). We do not want to spam
                 # INFO messages about REST services
-                LOGGER.debug('SOAP: %s: %s', method_name, err)
+                LOGGER.debug('SOAP: %s: %s', identifier_path(method), err)
             else:
-                LOGGER.info('SOAP: %s: %s', method_name, err)
-            method_index[method_name] = method_item(method, 'ERROR', '')
+                LOGGER.info('SOAP: %s: %s', identifier_path(method), err)
+            method_index[method] = method_item(method, 'ERROR', '')
             continue
 
         try:
-            wsdl_name, hashes = save_wsdl(wsdl_path, hashes, wsdl, params['wsdl_replaces'], params)
+            wsdl_name = save_wsdl(wsdl_path, index, wsdl, params['wsdl_replaces'], params)
         except OSError as err:
-            LOGGER.warning('SOAP: %s: %s', method_name, err)
-            method_index[method_name] = method_item(method, 'ERROR', '')
+            LOGGER.warning('SOAP: %s: %s', identifier_path(method), err)
+            method_index[method] = method_item(method, 'ERROR', '')
             continue
 
-        txt = 'SOAP: {}'.format(wsdl_name)
+        txt = ['SOAP: {}'.format(wsdl_name)] if log_info else None
+        # All methods of a WSDL refer to the same document
+        wsdl_url = urlparse.quote('{}/{}'.format(doc_path, wsdl_name))
         try:
             for wsdl_method in xrdinfo.wsdl_methods(wsdl):
-                wsdl_method_name = identifier_path(subsystem + wsdl_method)
                 # We can find other methods in a method WSDL
-                method_index[wsdl_method_name] = method_item(
-                    subsystem + wsdl_method, 'OK', urlparse.quote(
-                        '{}/{}'.format(doc_path, wsdl_name)))
-                txt = txt + '\n    {}'.format(wsdl_method_name)
+                full_method = subsystem + wsdl_method
+                method_index[full_method] = method_item(full_method, 'OK', wsdl_url)
+                if log_info:
+                    # Subsystem path is already known
+                    txt.append('    {}/{}'.format(doc_path, identifier_path(wsdl_method)))
         except xrdinfo.XrdInfoError as err:
-            txt = txt + '\nWSDL parsing failed: {}'.format(err)
-            method_index[method_name] = method_item(method, 'ERROR', '')
-        LOGGER.info(txt)
+            if log_info:
+                txt.append('WSDL parsing failed: {}'.format(err))
+            method_index[method] = method_item(method, 'ERROR', '')
+        if log_info:
+            LOGGER.info('\n'.join(txt))
 
-        if method_name not in method_index:
+        if method not in method_index:
             LOGGER.warning(
-                'SOAP: %s - Method was not found in returned WSDL!', method_name)
-            method_index[method_name] = method_item(method, 'ERROR', '')
+                'SOAP: %s - Method was not found in returned WSDL!', identifier_path(method))
+            method_index[method] = method_item(method, 'ERROR', '')
 
-    save_hashes(wsdl_path, hashes, 'wsdl', params)
+    save_hashes(wsdl_path, index['hashes'], 'wsdl', params)
 
     return method_index
 
@@ -593,64 +794,63 @@ def process_services(subsystem, params, doc_path):
     try:
         if not params['minio']:
             make_dirs(openapi_path)
-        hashes = get_openapi_hashes(openapi_path, params)
+        index = openapi_index(get_hashes(openapi_path, 'openapi', params))
     except OSError as err:
-        LOGGER.warning('REST: %s: %s', identifier_path(subsystem), err)
+        LOGGER.warning('REST: %s: %s', doc_path, err)
         return None
 
     results = []
     skip_services = False
 
     try:
-        # Converting iterator to list to properly capture exceptions
-        services = list(xrdinfo.methods_rest(
+        # Consuming iterator inside try to properly capture exceptions
+        services = sorted(xrdinfo.methods_rest(
             addr=params['url'], client=params['client'], producer=subsystem,
             method='listMethods', timeout=params['timeout'], verify=params['verify'],
-            cert=params['cert']))
+            cert=params['cert'], session=params['session']))
     except xrdinfo.XrdInfoError as err:
-        LOGGER.info('REST: %s: %s', identifier_path(subsystem), err)
+        LOGGER.info('REST: %s: %s', doc_path, err)
         return None
 
-    for service in sorted(services):
-        service_name = identifier_path(service)
-
+    for service in services:
         if skip_services:
             # Skipping, because previous getOpenAPI request timed out
-            LOGGER.info('REST: %s - SKIPPING', service_name)
+            LOGGER.info('REST: %s - SKIPPING', identifier_path(service))
             results.append(service_item(service, 'SKIPPED', '', []))
             continue
 
         try:
             openapi = xrdinfo.openapi(
                 addr=params['url'], client=params['client'], service=service,
-                timeout=params['timeout'], verify=params['verify'], cert=params['cert'])
+                timeout=params['timeout'], verify=params['verify'], cert=params['cert'],
+                session=params['session'])
         except xrdinfo.RequestTimeoutError:
             # Skipping all following requests to that subsystem
             skip_services = True
-            LOGGER.info('REST: %s - TIMEOUT', service_name)
+            LOGGER.info('REST: %s - TIMEOUT', identifier_path(service))
             results.append(service_item(service, 'TIMEOUT', '', []))
             continue
         except xrdinfo.NotOpenapiServiceError:
             results.append(service_item(service, 'OK', '', []))
             continue
         except xrdinfo.XrdInfoError as err:
-            LOGGER.info('REST: %s: %s', service_name, err)
+            LOGGER.info('REST: %s: %s', identifier_path(service), err)
             results.append(service_item(service, 'ERROR', '', []))
             continue
 
         try:
-            _, openapi_type = xrdinfo.load_openapi(openapi)
-            endpoints = xrdinfo.openapi_endpoints(openapi)
+            openapi_data, openapi_type = xrdinfo.load_openapi(openapi)
+            endpoints = xrdinfo.openapi_endpoints(openapi, data=openapi_data)
         except xrdinfo.XrdInfoError as err:
-            LOGGER.info('REST: %s: %s', service_name, err)
+            LOGGER.info('REST: %s: %s', identifier_path(service), err)
             results.append(service_item(service, 'ERROR', '', []))
             continue
 
         try:
-            openapi_name, hashes = save_openapi(
-                openapi_path, hashes, openapi, service[4], openapi_type, params)
+            openapi_name = save_openapi(
+                openapi_path, index, openapi, service[4], openapi_type, params)
         except OSError as err:
-            LOGGER.warning('REST: %s: %s', service_name, err)
+            LOGGER.warning('REST: %s: %s', identifier_path(service), err)
             results.append(service_item(service, 'ERROR', '', []))
             continue
 
@@ -658,107 +858,74 @@ def process_services(subsystem, params, doc_path):
             service_item(service, 'OK', urlparse.quote(
                 '{}/{}'.format(doc_path, openapi_name)), endpoints))
 
-    save_hashes(openapi_path, hashes, 'openapi', params)
+    save_hashes(openapi_path, index['hashes'], 'openapi', params)
 
     return results
 
 
-def worker(params):
-    """Main function for worker threads"""
-    while True:
-        # Checking periodically if it is the time to gracefully shut down
-        # the worker.
-        try:
-            subsystem = params['work_queue'].get(True, 0.1)
-            LOGGER.info('Start processing %s', identifier_path(subsystem))
-        except queue.Empty:
-            if params['shutdown'].is_set():
-                return
-            continue
-        subsystem_path = ''
-        try:
-            subsystem_path = identifier_path(subsystem)
-            methods_result = process_methods(subsystem, params, subsystem_path)
-            services_result = process_services(subsystem, params, subsystem_path)
-
-            with params['results_lock']:
-                params['results'][subsystem_path] = subsystem_item(
-                    subsystem, methods_result, services_result)
-        # Using broad exception to avoid unexpected exits of workers
-        except Exception as err:
-            with params['results_lock']:
-                params['results'][subsystem_path] = subsystem_item(subsystem, None, None)
-            LOGGER.warning('Unexpected exception: %s: %s', type(err).__name__, err)
-        finally:
-            params['work_queue'].task_done()
+def process_subsystem(subsystem, params):
+    """Process a single subsystem in worker thread and return its result"""
+    subsystem_path = identifier_path(subsystem)
+    LOGGER.info('Start processing %s', subsystem_path)
+    try:
+        # REST services are processed concurrently with SOAP methods
+        services_future = params['services_pool'].submit(
+            process_services, subsystem, params, subsystem_path)
+        methods_result = process_methods(subsystem, params, subsystem_path)
+        return subsystem_item(subsystem, methods_result, services_future.result())
+    # Using broad exception to avoid unexpected exits of workers
+    except Exception as err:
+        LOGGER.warning('Unexpected exception: %s: %s', type(err).__name__, err)
+        return subsystem_item(subsystem, None, None)
 
 
 def hour_start(src_time):
     """Return the beginning of the hour of the specified datetime"""
-    return datetime(src_time.year, src_time.month, src_time.day, src_time.hour)
+    return src_time.replace(minute=0, second=0, microsecond=0)
 
 
 def day_start(src_time):
     """Return the beginning of the day of the specified datetime"""
-    return datetime(src_time.year, src_time.month, src_time.day)
+    return src_time.replace(hour=0, minute=0, second=0, microsecond=0)
 
 
 def month_start(src_time):
     """Return the beginning of the month of the specified datetime"""
-    return datetime(src_time.year, src_time.month, 1)
-
-
-def year_start(src_time):
-    """Return the beginning of the year of the specified datetime"""
-    return datetime(src_time.year, 1, 1)
+    return src_time.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
 
 
 def add_months(src_time, amount):
     """Adds specified amount of months to datetime value.
     Specifying negative amount will result in subtraction of months.
     """
-    return src_time.replace(
-        # To find the year correction we convert the month from 1..12 to
-        # 0..11 value, add amount of months and find the integer
-        # part of division by 12.
-        year=src_time.year + (src_time.month - 1 + amount) // 12,
-        # To find the new month we convert the month from 1..12 to
-        # 0..11 value, add amount of months, find the remainder
-        # part after division by 12 and convert the month back
-        # to the 1..12 form.
-        month=(src_time.month - 1 + amount) % 12 + 1)
-
-
-def shift_current_hour(offset):
-    """Shifts current hour by a specified offset"""
-    start = hour_start(datetime.today())
+    # To find the year correction and the new month we convert the month
+    # from 1..12 to 0..11 value, add amount of months and divide by 12.
+    # Integer part is the year correction and the remainder is the new
+    # month that is converted back to the 1..12 form.
+    years, month = divmod(src_time.month - 1 + amount, 12)
+    return src_time.replace(year=src_time.year + years, month=month + 1)
+
+
+def shift_current_hour(offset, now=None):
+    """Shifts current hour by a specified offset. Current time may be
+    provided to use the same time in several calculations.
+    """
+    start = hour_start(now or datetime.today())
     return start + timedelta(hours=offset)
 
 
-def shift_current_day(offset):
-    """Shifts current hour by a specified offset"""
-    start = day_start(datetime.today())
+def shift_current_day(offset, now=None):
+    """Shifts current day by a specified offset"""
+    start = day_start(now or datetime.today())
     return start + timedelta(days=offset)
 
 
-def shift_current_month(offset):
-    """Shifts current hour by a specified offset"""
-    start = month_start(datetime.today())
+def shift_current_month(offset, now=None):
+    """Shifts current month by a specified offset"""
+    start = month_start(now or datetime.today())
     return add_months(start, offset)
 
 
-def add_filtered(filtered, item_key, report_time, history_item, min_time):
-    """Add report to the list of filtered reports"""
-    if min_time is None or item_key >= min_time:
-        if item_key not in filtered or report_time < filtered[item_key]['time']:
-            filtered[item_key] = {'time': report_time, 'item': history_item}
-
-
-def sort_by_report_time(item):
-    """A helper function for sorting, indicates which field to use"""
-    return item['reportTime']
-
-
 def all_results_failed(subsystems):
     """Check if all results have failed status"""
     for subsystem in subsystems.values():
@@ -769,57 +936,128 @@ def all_results_failed(subsystems):
     return True
 
 
-def write_json(file_name, json_data, params):
-    """Write data to JSON file"""
+def write_json(file_name, json_data, params, copies=(), indent=True):
+    """Write data to JSON file and optionally to copies of that file.
+    Data is serialized only once. Files that are only read by collector
+    may be written without indentation.
+    """
+    # orjson output matches json.dumps with indent=2 and
+    # ensure_ascii=False, except for values that may only come from
+    # OpenAPI documents of service providers:
+    # * float exponents are written as "1e16" and "1e-7" instead of
+    #   "1e+16" and "1e-07", which are the same JSON numbers;
+    # * NaN and Infinity are written as null, json.dumps writes tokens
+    #   that are not valid JSON and that browsers fail to parse;
+    # * dates and datetimes parsed from YAML are written as ISO strings,
+    #   json.dumps failed the whole run on them.
+    # Non-string keys and integers wider than 64 bits are not supported
+    # by orjson, stdlib json is used for such data.
+    option = orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    try:
+        json_binary = orjson.dumps(json_data, option=option)
+    except orjson.JSONEncodeError:
+        json_binary = json.dumps(
+            json_data, indent=2 if indent else None,
+            separators=None if indent else (',', ':'), ensure_ascii=False).encode('utf-8')
     if params['minio']:
-        json_binary = json.dumps(json_data, indent=2, ensure_ascii=False).encode()
-        params['minio_client'].put_object(
-            params['minio_bucket'], file_name,
-            BytesIO(json_binary), len(json_binary), content_type='application/json')
+        for name in (file_name,) + tuple(copies):
+            params['minio_client'].put_object(
+                params['minio_bucket'], name,
+                BytesIO(json_binary), len(json_binary), content_type='application/json')
     else:
-        with open(file_name, 'w') as json_file:
-            json.dump(json_data, json_file, indent=2, ensure_ascii=False)
+        write_atomic(file_name, json_binary)
+        for name in copies:
+            link_or_write(file_name, name, json_binary)
 
 
-def filtered_history(json_history, params):
-    """Get filtered reports history"""
-    min_hour = shift_current_hour(-params['filtered_hours'])
-    min_day = shift_current_day(-params['filtered_days'])
-    min_month = shift_current_month(-params['filtered_months'])
-    filtered_items = {}
-    for history_item in json_history:
-        report_time = datetime.strptime(history_item['reportTime'], '%Y-%m-%d %H:%M:%S')
+def tmp_file_name(file_name):
+    """Return temporary name used while writing local file"""
+    return '{}.tmp.{}'.format(file_name, os.getpid())
 
-        item_key = hour_start(report_time)
-        add_filtered(filtered_items, item_key, report_time, history_item, min_hour)
 
-        item_key = day_start(report_time)
-        add_filtered(filtered_items, item_key, report_time, history_item, min_day)
+def remove_tmp_file(tmp_file):
+    """Remove temporary file if it exists"""
+    try:
+        os.unlink(tmp_file)
+    except FileNotFoundError:
+        pass
 
-        item_key = month_start(report_time)
-        add_filtered(filtered_items, item_key, report_time, history_item, min_month)
 
-        # Adding all available years
-        item_key = year_start(report_time)
-        add_filtered(filtered_items, item_key, report_time, history_item, None)
+def write_atomic(file_name, data):
+    """Write data to local file under temporary name and rename it, so
+    that an interrupted write never leaves a partial file behind.
+    """
+    tmp_file = tmp_file_name(file_name)
+    try:
+        with open(tmp_file, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_file, file_name)
+    except OSError:
+        # Not leaving temporary file behind (for example when disk is full)
+        remove_tmp_file(tmp_file)
+        raise
+
+
+def link_or_write(src_file, dst_file, data):
+    """Replace local file with a hard link to another file containing
+    the same data. Link is created under temporary name and renamed, so
+    that readers never see a partial file. Data is written if linking
+    is not supported.
+    """
+    tmp_file = tmp_file_name(dst_file)
+    try:
+        remove_tmp_file(tmp_file)
+        os.link(src_file, tmp_file)
+        os.replace(tmp_file, dst_file)
+    except OSError:
+        # Removing the link before writing, otherwise the source file
+        # would be overwritten through it
+        remove_tmp_file(tmp_file)
+        write_atomic(dst_file, data)
+
+
+def filtered_history(json_history, params):
+    """Get filtered reports history. History must be sorted newest first."""
+    now = datetime.today()
+    min_hour = shift_current_hour(-params['filtered_hours'], now)
+    min_day = shift_current_day(-params['filtered_days'], now)
+    min_month = shift_current_month(-params['filtered_months'], now)
+    # Buckets are keyed by tuples that are cheaper to create than datetime
+    min_hour = (min_hour.year, min_hour.month, min_hour.day, min_hour.hour)
+    min_day = (min_day.year, min_day.month, min_day.day)
+    min_month = (min_month.year, min_month.month)
 
     # Latest report is always added to filtered history
     latest = json_history[0]
     unique_items = {latest['reportTime']: latest}
-    for val in filtered_items.values():
-        item = val['item']
-        unique_items[item['reportTime']] = item
+    # Going from the oldest report, so that the first report found in
+    # an hour, day, month or year is the one kept for it
+    filtered_keys = set()
+    for history_item in reversed(json_history):
+        # History times use '%Y-%m-%d %H:%M:%S' format, that is parsed
+        # faster by fromisoformat than by strptime
+        report_time = datetime.fromisoformat(history_item['reportTime'])
+        year, month, day = report_time.year, report_time.month, report_time.day
+        # Keeping the first report of each hour, day and month within the
+        # limits and of all available years
+        for item_key, min_time in (
+                ((year, month, day, report_time.hour), min_hour), ((year, month, day), min_day),
+                ((year, month), min_month), ((year,), None)):
+            if (min_time is None or item_key >= min_time) and item_key not in filtered_keys:
+                filtered_keys.add(item_key)
+                unique_items[history_item['reportTime']] = history_item
 
     json_filtered_history = list(unique_items.values())
-    json_filtered_history.sort(key=sort_by_report_time, reverse=True)
+    json_filtered_history.sort(key=REPORT_TIME_KEY, reverse=True)
 
     return json_filtered_history
 
 
 def add_report_file(file_name, reports, history=False):
     """Add report to reports list if filename matches"""
-    search_res = re.search(
-        '^index_(\\d{4})(\\d{2})(\\d{2})(\\d{2})(\\d{2})(\\d{2})\\.json$', file_name)
+    search_res = REPORT_NAME_RE.match(file_name)
     if search_res and history:
         reports.append({
             'reportTime': '{}-{}-{} {}:{}:{}'.format(
@@ -836,156 +1074,194 @@ def add_report_file(file_name, reports, history=False):
             'reportPath': file_name})
 
 
-def get_catalogue_reports(params, history=False):
-    """Get list of reports"""
+def get_catalogue_reports(report_files, history=False, sort=True):
+    """Get list of reports from report file names. Reports are sorted
+    newest first unless sorting is disabled.
+    """
     reports = []
-    if params['minio']:
-        for obj in params['minio_client'].list_objects(
-                params['minio_bucket'], prefix=params['minio_path'], recursive=False):
-            file_name = obj.object_name[len(params['minio_path']):]
-            add_report_file(file_name, reports, history=history)
-    else:
-        for file_name in os.listdir(params['path']):
-            add_report_file(file_name, reports, history=history)
-    reports.sort(key=sort_by_report_time, reverse=True)
+    for file_name in report_files:
+        add_report_file(file_name, reports, history=history)
+    if sort:
+        reports.sort(key=REPORT_TIME_KEY, reverse=True)
     return reports
 
 
 def get_reports_to_keep(reports, fresh_time):
-    """Get reports that must not be removed during cleanup"""
+    """Get paths of reports that must not be removed during cleanup"""
     # Latest report is never deleted
-    unique_paths = {reports[0]['reportTime']: reports[0]['reportPath']}
+    paths_to_keep = {max(reports, key=REPORT_TIME_KEY)['reportPath']}
 
     filtered_items = {}
     for report in reports:
         if report['reportTime'] >= fresh_time:
             # Keeping all fresh reports
-            unique_paths[report['reportTime']] = report['reportPath']
+            paths_to_keep.add(report['reportPath'])
         else:
             # Searching for the first report in a day
-            item_key = datetime(
-                report['reportTime'].year, report['reportTime'].month, report['reportTime'].day)
+            item_key = report['reportTime'].date()
             if item_key not in filtered_items \
                     or report['reportTime'] < filtered_items[item_key]['reportTime']:
-                filtered_items[item_key] = {
-                    'reportTime': report['reportTime'], 'reportPath': report['reportPath']}
+                filtered_items[item_key] = report
 
     # Adding first report of the day
-    for item in filtered_items.values():
-        unique_paths[item['reportTime']] = item['reportPath']
-
-    paths_to_keep = list(unique_paths.values())
-    paths_to_keep.sort()
+    paths_to_keep.update(report['reportPath'] for report in filtered_items.values())
 
     return paths_to_keep
 
 
-def get_old_reports(params):
+def get_old_reports(params, report_files):
     """Get old reports that need to be removed"""
-    old_reports = []
-    all_reports = get_catalogue_reports(params)
-    cur_time = datetime.today()
-    fresh_time = datetime(cur_time.year, cur_time.month, cur_time.day) - timedelta(
-        days=params['days_to_keep'])
+    all_reports = get_catalogue_reports(report_files, sort=False)
+    fresh_time = shift_current_day(-params['days_to_keep'])
     paths_to_keep = get_reports_to_keep(all_reports, fresh_time)
 
-    for report in all_reports:
-        if not report['reportPath'] in paths_to_keep:
-            old_reports.append(report['reportPath'])
+    old_reports = [
+        report['reportPath'] for report in all_reports
+        if report['reportPath'] not in paths_to_keep]
 
+    # Removing reports in chronological order
     old_reports.sort()
     return old_reports
 
 
 def get_reports_set(params):
-    """Get set of reports"""
+    """Get set of report file names"""
     reports = set()
     if params['minio']:
+        prefix_len = len(params['minio_path'])
         for obj in params['minio_client'].list_objects(
                 params['minio_bucket'], prefix=params['minio_path'], recursive=False):
-            file_name = obj.object_name[len(params['minio_path']):]
-            search_res = re.search(
-                '^index_(\\d{4})(\\d{2})(\\d{2})(\\d{2})(\\d{2})(\\d{2})\\.json$',
-                file_name)
-            if search_res:
+            file_name = obj.object_name[prefix_len:]
+            if REPORT_NAME_RE.match(file_name):
                 reports.add(file_name)
     else:
-        for file_name in os.listdir(params['path']):
-            search_res = re.search(
-                '^index_(\\d{4})(\\d{2})(\\d{2})(\\d{2})(\\d{2})(\\d{2})\\.json$',
-                file_name)
-            if search_res:
-                reports.add(file_name)
+        with os.scandir(params['path']) as entries:
+            for entry in entries:
+                if REPORT_NAME_RE.match(entry.name) and entry.is_file(follow_symlinks=False):
+                    reports.add(entry.name)
     return reports
 
 
 def get_docs_in_report(params, report_file):
     if params['minio']:
-        obj = params['minio_client'].get_object(
-            params['minio_bucket'], '{}{}'.format(params['minio_path'], report_file))
-        report_data = json.loads(obj.data.decode('utf-8'))
+        report_data = orjson.loads(
+            read_minio_object('{}{}'.format(params['minio_path'], report_file), params))
     else:
-        with open('{}/{}'.format(params['path'], report_file), 'r') as json_file:
-            report_data = json.load(json_file)
-
-    used_docs = set()
-    for system in report_data:
-        for method in system['methods']:
-            if method['wsdl']:
-                if params['minio']:
-                    used_docs.add('{}{}'.format(params['minio_path'], method['wsdl']))
-                else:
-                    used_docs.add('{}/{}'.format(params['path'], method['wsdl']))
-        if 'services' in system:
-            for service in system['services']:
-                if service['openapi']:
-                    if params['minio']:
-                        used_docs.add('{}{}'.format(params['minio_path'], service['openapi']))
-                    else:
-                        used_docs.add('{}/{}'.format(params['path'], service['openapi']))
+        with open('{}/{}'.format(params['path'], report_file), 'rb') as json_file:
+            report_data = orjson.loads(json_file.read())
+
+    # Storage prefix is the same for all documents
+    prefix = params['minio_path'] if params['minio'] else '{}/'.format(params['path'])
+    # Report contains URL encoded paths
+    used_docs = {
+        prefix + urlparse.unquote(method['wsdl'])
+        for system in report_data for method in system['methods'] if method['wsdl']}
+    used_docs.update(
+        prefix + urlparse.unquote(service['openapi'])
+        for system in report_data if 'services' in system
+        for service in system['services'] if service['openapi'])
     return used_docs
 
 
 def add_doc_file(file_name, path, docs):
-    search_res = re.search('^\\d+\\.wsdl$', file_name)
-    if search_res:
-        docs.add(os.path.join(path, file_name))
-    search_res = re.search('^.+_(\\d+)\\.(yaml|json)$', file_name)
-    if search_res:
-        docs.add(os.path.join(path, file_name))
+    if ANY_DOC_NAME_RE.match(file_name) or file_name in LEGACY_HASHES_FILES:
+        docs.setdefault(path, set()).add(file_name)
+
+
+def get_minio_prefixes(prefix, params):
+    """Get MinIO "directories" directly under prefix"""
+    return [
+        obj.object_name for obj in params['minio_client'].list_objects(
+            params['minio_bucket'], prefix=prefix, recursive=False) if obj.is_dir]
+
+
+def get_minio_docs(prefix, params):
+    """Get MinIO document file names under prefix grouped by directory"""
+    docs = {}
+    for obj in params['minio_client'].list_objects(
+            params['minio_bucket'], prefix=prefix, recursive=True):
+        # Object names always use '/' as separator
+        doc_dir, _, file_name = obj.object_name.rpartition('/')
+        add_doc_file(file_name, doc_dir, docs)
+    return docs
 
 
 def get_available_docs(params):
-    available_docs = set()
+    """Get available document file names grouped by directory"""
+    available_docs = {}
     if params['minio']:
-        for obj in params['minio_client'].list_objects(
-                params['minio_bucket'],
-                prefix=os.path.join(params['minio_path'], params['instance']),
-                recursive=True):
-            add_doc_file(
-                os.path.basename(obj.object_name), os.path.dirname(obj.object_name), available_docs)
+        # Listing members of each member class in parallel and then
+        # documents of each member in parallel. Smaller listings do not
+        # depend on long chains of continuation requests.
+        class_prefixes = get_minio_prefixes(
+            '{}{}/'.format(params['minio_path'], params['instance']), params)
+        with ThreadPoolExecutor(max_workers=params['thread_cnt']) as executor:
+            member_prefixes = [
+                prefix for prefixes in executor.map(
+                    get_minio_prefixes, class_prefixes, repeat(params)) for prefix in prefixes]
+            for docs in executor.map(get_minio_docs, member_prefixes, repeat(params)):
+                # Members do not share directories
+                available_docs.update(docs)
     else:
+        # os.walk uses os.scandir and does not stat the listed files
         for root, _, files in os.walk(os.path.join(params['path'], params['instance'])):
             for file_name in files:
                 add_doc_file(file_name, root, available_docs)
     return available_docs
 
 
-def get_unused_docs(params):
-    reports = get_reports_set(params)
+def get_unused_docs(params, reports):
+    """Get unused document file names grouped by directory"""
     if not reports:
         LOGGER.warning('Did not find any reports!')
-        return set()
+        return {}
 
     used_docs = set()
-    for report_file in reports:
-        used_docs = used_docs.union(get_docs_in_report(params, report_file))
+    # Reading reports in parallel
+    with ThreadPoolExecutor(max_workers=params['thread_cnt']) as executor:
+        for docs in executor.map(get_docs_in_report, repeat(params), reports):
+            used_docs.update(docs)
     if not used_docs:
         LOGGER.info('Did not find any documents in reports. This is might be an error.')
-        return set()
-
-    available_docs = get_available_docs(params)
-    return available_docs - used_docs
+        return {}
+
+    unused_docs = {}
+    for doc_dir, file_names in get_available_docs(params).items():
+        unused_in_dir = {
+            file_name for file_name in file_names
+            if os.path.join(doc_dir, file_name) not in used_docs}
+        if unused_in_dir:
+            unused_docs[doc_dir] = unused_in_dir
+    return unused_docs
+
+
+def remove_minio_objects(object_names, params):
+    """Remove MinIO objects with batch delete requests"""
+    for object_name in object_names:
+        LOGGER.debug('Removing %s', object_name)
+    # Errors are returned lazily, deletion happens while iterating
+    errors = params['minio_client'].remove_objects(
+        params['minio_bucket'], (DeleteObject(object_name) for object_name in object_names))
+    for error in errors:
+        LOGGER.warning('Failed to remove %s: %s', error.name, error.message)
+
+
+def prune_hashes(doc_dir, file_names, params):
+    """Remove deleted documents from hashes cache of a directory. Cache is
+    rebuilt only when missing.
+    """
+    # MinIO paths of documents directories end with '/'
+    hashes_path = '{}/'.format(doc_dir) if params['minio'] else doc_dir
+    LOGGER.info('Updating WSDL hashes cache for %s', doc_dir)
+    hashes = get_hashes(hashes_path, 'wsdl', params)
+    save_hashes(hashes_path, {
+        file_name: doc_hash for file_name, doc_hash in hashes.items()
+        if file_name not in file_names}, 'wsdl', params)
+    LOGGER.info('Updating OpenAPI hashes cache for %s', doc_dir)
+    hashes = get_hashes(hashes_path, 'openapi', params)
+    save_hashes(hashes_path, {
+        file_name: doc_hash for file_name, doc_hash in hashes.items()
+        if file_name not in file_names}, 'openapi', params)
 
 
 def start_cleanup(params):
@@ -993,16 +1269,15 @@ def start_cleanup(params):
     last_cleanup = None
     if params['minio']:
         try:
-            json_file = params['minio_client'].get_object(
-                params['minio_bucket'], '{}cleanup_status.json'.format(params['minio_path']))
-            cleanup_status = json.loads(json_file.data.decode('utf-8'))
+            cleanup_status = orjson.loads(read_minio_object(
+                '{}cleanup_status.json'.format(params['minio_path']), params))
             last_cleanup = datetime.strptime(cleanup_status['lastCleanup'], '%Y-%m-%d %H:%M:%S')
         except (S3Error, ValueError):
             LOGGER.info('Cleanup status not found')
     else:
         try:
-            with open('{}/cleanup_status.json'.format(params['path']), 'r') as json_file:
-                cleanup_status = json.load(json_file)
+            with open('{}/cleanup_status.json'.format(params['path']), 'rb') as json_file:
+                cleanup_status = orjson.loads(json_file.read())
                 last_cleanup = datetime.strptime(cleanup_status['lastCleanup'], '%Y-%m-%d %H:%M:%S')
         except (IOError, ValueError):
             LOGGER.info('Cleanup status not found')
@@ -1014,21 +1289,26 @@ def start_cleanup(params):
 
     LOGGER.info('Starting cleanup')
 
+    # Listing reports once for the whole cleanup
+    report_files = get_reports_set(params)
+
     # Cleanup reports
-    old_reports = get_old_reports(params)
+    old_reports = get_old_reports(params, report_files)
     if len(old_reports):
-        LOGGER.info('Removing %s old JSON reports:', len(old_reports))
-        for report_path in old_reports:
-            if params['minio']:
-                LOGGER.info('Removing %s%s', params['minio_path'], report_path)
-                params['minio_client'].remove_object(
-                    params['minio_bucket'], '{}{}'.format(params['minio_path'], report_path))
-            else:
-                LOGGER.info('Removing %s/%s', params['path'], report_path)
-                os.remove('{}/{}'.format(params['path'], report_path))
+        LOGGER.info('Removing %s old JSON reports', len(old_reports))
+        if params['minio']:
+            remove_minio_objects(
+                ['{}{}'.format(params['minio_path'], report_path) for report_path in old_reports],
+                params)
+        else:
+            for report_path in old_reports:
+                LOGGER.debug('Removing %s/%s', params['path'], report_path)
+                os.unlink('{}/{}'.format(params['path'], report_path))
+
+        report_files.difference_update(old_reports)
 
         # Recreating history.json
-        reports = get_catalogue_reports(params, history=True)
+        reports = get_catalogue_reports(report_files, history=True)
         if len(reports):
             LOGGER.info('Writing %s reports to history.json', len(reports))
             if params['minio']:
@@ -1039,36 +1319,45 @@ def start_cleanup(params):
         LOGGER.info('No old JSON reports found in directory: %s', params['path'])
 
     # Cleanup documents
-    unused_docs = get_unused_docs(params)
-    changed_dirs = set()
-    if unused_docs:
-        LOGGER.info('Removing {} unused document(s):'.format(len(unused_docs)))
-        for doc_path in unused_docs:
-            LOGGER.info('Removing %s', doc_path)
-            if params['minio']:
-                params['minio_client'].remove_object(params['minio_bucket'], doc_path)
-            else:
-                os.remove(doc_path)
-            changed_dirs.add(os.path.dirname(doc_path))
+    # Removed file names grouped by directory
+    removed_docs = get_unused_docs(params, report_files)
+    if removed_docs:
+        LOGGER.info(
+            'Removing %s unused document(s) from %s directories',
+            sum(len(file_names) for file_names in removed_docs.values()), len(removed_docs))
+        if params['minio']:
+            remove_minio_objects([
+                os.path.join(doc_dir, file_name)
+                for doc_dir, file_names in removed_docs.items() for file_name in file_names],
+                params)
+        else:
+            # Removing documents directory by directory
+            for doc_dir, file_names in removed_docs.items():
+                for file_name in file_names:
+                    doc_path = os.path.join(doc_dir, file_name)
+                    LOGGER.debug('Removing %s', doc_path)
+                    os.unlink(doc_path)
     else:
         LOGGER.info('No unused documents found')
 
-    # Recreating document hashes cache
-    for doc_path in changed_dirs:
-        LOGGER.info('Recreating WSDL hashes cache for %s', doc_path)
-        hashes = get_wsdl_hashes(doc_path, params)
-        save_hashes(doc_path, hashes, 'wsdl', params)
-        LOGGER.info('Recreating OpenAPI hashes cache for %s', doc_path)
-        hashes = get_openapi_hashes(doc_path, params)
-        save_hashes(doc_path, hashes, 'openapi', params)
+    # Removing deleted documents from hashes cache instead of rehashing
+    # the remaining documents. Directories are independent and updated
+    # in parallel.
+    with ThreadPoolExecutor(max_workers=params['thread_cnt']) as executor:
+        # Consuming results to propagate exceptions
+        list(executor.map(
+            prune_hashes, removed_docs.keys(), removed_docs.values(), repeat(params)))
 
     # Updating status
     cleanup_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
     json_status = {'lastCleanup': cleanup_time}
     if params['minio']:
-        write_json('{}cleanup_status.json'.format(params['minio_path']), json_status, params)
+        write_json(
+            '{}cleanup_status.json'.format(params['minio_path']), json_status, params,
+            indent=False)
     else:
-        write_json('{}/cleanup_status.json'.format(params['path']), json_status, params)
+        write_json(
+            '{}/cleanup_status.json'.format(params['path']), json_status, params, indent=False)
 
 
 def process_results(params):
@@ -1081,36 +1370,46 @@ def process_results(params):
         sys.exit(1)
 
     json_data = []
-    for subsystem_key in sorted(results.keys()):
-        json_data.append(results[subsystem_key])
+    # Subsystem identifiers are tuples, sorting them directly
+    for subsystem in sorted(results):
+        json_data.append(results[subsystem])
 
     report_time = time.localtime(time.time())
     formatted_time = time.strftime('%Y-%m-%d %H:%M:%S', report_time)
     suffix = time.strftime('%Y%m%d%H%M%S', report_time)
 
+    # Writing index.json together with the report instead of copying the
+    # report file afterwards
     if params['minio']:
-        write_json('{}index_{}.json'.format(params['minio_path'], suffix), json_data, params)
+        write_json(
+            '{}index_{}.json'.format(params['minio_path'], suffix), json_data, params,
+            copies=('{}index.json'.format(params['minio_path']),))
     else:
-        write_json('{}/index_{}.json'.format(params['path'], suffix), json_data, params)
+        write_json(
+            '{}/index_{}.json'.format(params['path'], suffix), json_data, params,
+            copies=('{}/index.json'.format(params['path']),))
 
     json_history = []
     if params['minio']:
         try:
-            json_history_file = params['minio_client'].get_object(
-                params['minio_bucket'], '{}history.json'.format(params['minio_path']))
-            json_history = json.loads(json_history_file.data.decode('utf-8'))
+            json_history = orjson.loads(read_minio_object(
+                '{}history.json'.format(params['minio_path']), params))
         except S3Error:
             LOGGER.info('History file history.json not found')
     else:
         try:
-            with open('{}/history.json'.format(params['path']), 'r') as json_file:
-                json_history = json.load(json_file)
+            with open('{}/history.json'.format(params['path']), 'rb') as json_file:
+                json_history = orjson.loads(json_file.read())
         except IOError:
             LOGGER.info('History file history.json not found')
 
-    json_history.append({'reportTime': formatted_time, 'reportPath': 'index_{}.json'.format(
-        suffix)})
-    json_history.sort(key=sort_by_report_time, reverse=True)
+    history_item = {'reportTime': formatted_time, 'reportPath': 'index_{}.json'.format(suffix)}
+    # History is stored newest first, new report is normally the newest one
+    if not json_history or formatted_time > json_history[0]['reportTime']:
+        json_history.insert(0, history_item)
+    else:
+        json_history.append(history_item)
+        json_history.sort(key=REPORT_TIME_KEY, reverse=True)
 
     if params['minio']:
         write_json('{}history.json'.format(params['minio_path']), json_history, params)
@@ -1121,15 +1420,6 @@ def process_results(params):
         write_json('{}/filtered_history.json'.format(params['path']), filtered_history(
             json_history, params), params)
 
-    # Replace index.json with latest report
-    if params['minio']:
-        params['minio_client'].copy_object(
-            params['minio_bucket'], '{}index.json'.format(params['minio_path']),
-            '/{}/{}index_{}.json'.format(params['minio_bucket'], params['minio_path'], suffix))
-    else:
-        shutil.copy('{}/index_{}.json'.format(
-            params['path'], suffix), '{}/index.json'.format(params['path']))
-
     # Updating status
     json_status = {'lastReport': formatted_time}
     if params['minio']:
@@ -1171,45 +1461,54 @@ def main():
     if params['minio']:
         prepare_minio_client(params)
 
+    prepare_http_session(params)
+
     try:
         shared_params = xrdinfo.shared_params_ss(
             addr=params['url'], instance=params['instance'], timeout=params['timeout'],
-            verify=params['verify'], cert=params['cert'])
+            verify=params['verify'], cert=params['cert'], session=params['session'])
     except xrdinfo.XrdInfoError as err:
         LOGGER.error('Cannot download Global Configuration: %s', err)
         sys.exit(1)
 
-    # Create and start new threads
-    threads = []
-    for _ in range(params['thread_cnt']):
-        thread = Thread(target=worker, args=(params,))
-        thread.daemon = True
-        thread.start()
-        threads.append(thread)
+    if params['instance'] is None:
+        # Instance is required for cleanup of stored documents
+        try:
+            params['instance'] = xrdinfo.instance_identifier(shared_params)
+        except xrdinfo.XrdInfoError as err:
+            LOGGER.error('Cannot process Global Configuration: %s', err)
+            sys.exit(1)
+        LOGGER.info('Using instance from Global Configuration: %s', params['instance'])
 
-    # Populate the queue
+    subsystems = []
     try:
         for subsystem in xrdinfo.registered_subsystems(shared_params):
             if subsystem[2] in params['excluded_member_codes']:
                 LOGGER.info('Skipping excluded member %s', identifier_path(subsystem))
                 continue
-            if [subsystem[2], subsystem[3]] in params['excluded_subsystem_codes']:
+            if (subsystem[2], subsystem[3]) in params['excluded_subsystem_codes']:
                 LOGGER.info('Skipping excluded subsystem %s', identifier_path(subsystem))
                 continue
-            params['work_queue'].put(subsystem)
+            subsystems.append(subsystem)
     except xrdinfo.XrdInfoError as err:
         LOGGER.error('Cannot process Global Configuration: %s', err)
         sys.exit(1)
 
-    # Block until all tasks in queue are done
-    params['work_queue'].join()
+    # Global Configuration is no longer needed during the collection
+    del shared_params
+
+    # Stored documents are hashed in parallel during collection and cleanup
+    with ThreadPoolExecutor(max_workers=params['hash_thread_cnt']) as hash_pool:
+        params['hash_pool'] = hash_pool
 
-    # Set shutdown event and wait until all daemon processes finish
-    params['shutdown'].set()
-    for thread in threads:
-        thread.join()
+        # Workers return results, the main thread collects them
+        with ThreadPoolExecutor(max_workers=params['thread_cnt']) as executor, \
+                ThreadPoolExecutor(max_workers=params['thread_cnt']) as services_pool:
+            params['services_pool'] = services_pool
+            params['results'] = dict(zip(
+                subsystems, executor.map(process_subsystem, subsystems, repeat(params))))
 
-    process_results(params)
+        process_results(params)
 
 
 if __name__ == '__main__':
@@ -4,10 +4,10 @@
 
 __all__ = [
     'XrdInfoError', 'RequestTimeoutError', 'SoapFaultError', 'NotOpenapiServiceError',
-    'OpenapiReadError', 'shared_params_ss', 'shared_params_cs', 'members', 'subsystems',
-    'subsystems_with_membername', 'registered_subsystems', 'subsystems_with_server', 'servers',
-    'addr_ips', 'servers_ips', 'methods', 'methods_rest', 'wsdl', 'wsdl_methods', 'openapi',
-    'openapi_endpoints', 'identifier', 'identifier_parts']
+    'OpenapiReadError', 'shared_params_ss', 'shared_params_cs', 'instance_identifier', 'members',
+    'subsystems', 'subsystems_with_membername', 'registered_subsystems', 'subsystems_with_server',
+    'servers', 'addr_ips', 'servers_ips', 'methods', 'methods_rest', 'wsdl', 'wsdl_methods',
+    'openapi', 'openapi_endpoints', 'identifier', 'identifier_parts']
 __version__ = '1.2'
 __author__ = 'Vitali Stupin'
 
@@ -100,6 +100,21 @@ NS = {'xrd': 'http://x-road.eu/xsd/xroad.xsd',
       'id': 'http://x-road.eu/xsd/identifiers',
       'wsdl': 'http://schemas.xmlsoap.org/wsdl/'}
 
+# SOAP envelope inside X-Road response
+SOAP_ENVELOPE_RE = re.compile('<SOAP-ENV:Envelope.+</SOAP-ENV:Envelope>', re.DOTALL)
+
+# WSDL attachment inside multipart getWsdl response
+WSDL_MULTIPART_RE = re.compile(
+    '--xroad.+content-type:text/xml.+<SOAP-ENV:Envelope.+</SOAP-ENV:Envelope>'
+    '.+--xroad.+content-type:text/xml.*?\r\n\r\n(.+)\r\n--xroad.+', re.DOTALL)
+
+# Location of shared-params.xml in Global Configuration directory
+SHARED_PARAMS_LOCATION_RE = re.compile(
+    'Content-location: (/.+/shared-params.xml)', re.IGNORECASE)
+
+# Safe YAML loader, libyaml based loader is used when available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
 
 class XrdInfoError(Exception):
     """ XrdInfo generic Exception """
@@ -141,7 +156,7 @@ def raise_rest_exception(err, response):
         resp = json.loads(response.text)
         if resp['message'] == 'Invalid service type: REST':
             raise NotOpenapiServiceError('Service does not have OpenAPI description')
-        if re.search('^Failed reading service description from', resp['message']):
+        if resp['message'].startswith('Failed reading service description from'):
             raise OpenapiReadError('Failed reading service OpenAPI description')
         raise XrdInfoError('RestError: {}: {}'.format(resp['type'], resp['message']))
     except (AttributeError, json.JSONDecodeError, KeyError):
@@ -149,9 +164,11 @@ def raise_rest_exception(err, response):
         raise XrdInfoError(err)
 
 
-def shared_params_ss(addr, instance=None, timeout=DEFAULT_TIMEOUT, verify=False, cert=None):
+def shared_params_ss(
+        addr, instance=None, timeout=DEFAULT_TIMEOUT, verify=False, cert=None, session=None):
     """Get shared-params.xml content from local Security Server.
     By default return info about local X-Road instance.
+    Optional requests.Session may be used for connection reuse.
     """
     try:
         url = addr
@@ -165,7 +182,8 @@ def shared_params_ss(addr, instance=None, timeout=DEFAULT_TIMEOUT, verify=False,
             url = url + '/verificationconf'
         elif urlparse.urlsplit(url).path == '/':
             url = url + 'verificationconf'
-        ver_conf_response = requests.get(url, timeout=timeout, verify=verify, cert=cert)
+        ver_conf_response = (session or requests).get(
+            url, timeout=timeout, verify=verify, cert=cert)
         ver_conf_response.raise_for_status()
         zip_data = BytesIO()
         zip_data.write(ver_conf_response.content)
@@ -207,8 +225,7 @@ def shared_params_cs(addr, timeout=DEFAULT_TIMEOUT, verify=False, cert=None):
         global_conf = requests.get(url, timeout=timeout, verify=verify, cert=cert)
         global_conf.raise_for_status()
         # Configuration Proxy uses lowercase for 'Content-location'
-        search_res = re.search(
-            'Content-location: (/.+/shared-params.xml)', global_conf.text, re.IGNORECASE)
+        search_res = SHARED_PARAMS_LOCATION_RE.search(global_conf.text)
         url2 = urlparse.urljoin(url, search_res.group(1))
         shared_params_response = requests.get(url2, timeout=timeout, verify=verify, cert=cert)
         shared_params_response.raise_for_status()
@@ -220,6 +237,25 @@ def shared_params_cs(addr, timeout=DEFAULT_TIMEOUT, verify=False, cert=None):
         raise XrdInfoError(err)
 
 
+def instance_identifier(shared_params):
+    """Get X-Road instance identifier from shared_params.
+    Parsing stops as soon as the identifier is found.
+    """
+    try:
+        depth = 0
+        for event, elem in ElementTree.iterparse(
+                BytesIO(shared_params.encode('utf-8')), events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and elem.tag == 'instanceIdentifier':
+                return '' + elem.text
+    except Exception as err:
+        raise XrdInfoError(err)
+    raise XrdInfoError('Instance identifier not found')
+
+
 def members(shared_params):
     """List Members in shared_params.
     Return tuple: (xRoadInstance, memberClass, memberCode).
@@ -382,10 +418,11 @@ def servers_ips(shared_params):
 
 def methods(
         addr, client, producer, method='listMethods', timeout=DEFAULT_TIMEOUT, verify=False,
-        cert=None):
+        cert=None, session=None):
     """Get X-Road listMethods or allowedMethods response.
     Return tuple: (xRoadInstance, memberClass, memberCode,
     subsystemCode, serviceCode, serviceVersion).
+    Optional requests.Session may be used for connection reuse.
     """
     url = addr
     # Add HTTP/HTTPS scheme if missing
@@ -406,15 +443,14 @@ def methods(
 
     headers = {'content-type': 'text/xml'}
     try:
-        methods_response = requests.post(
+        methods_response = (session or requests).post(
             url, data=data.encode('utf-8'), headers=headers, timeout=timeout, verify=verify,
             cert=cert)
         methods_response.raise_for_status()
         methods_response.encoding = 'utf-8'
 
         # Some servers might return multipart message.
-        envel = re.search(
-            '<SOAP-ENV:Envelope.+</SOAP-ENV:Envelope>', methods_response.text, re.DOTALL)
+        envel = SOAP_ENVELOPE_RE.search(methods_response.text)
         try:
             root = ElementTree.fromstring(envel.group(0))
         except AttributeError:
@@ -448,10 +484,11 @@ def methods(
 
 def methods_rest(
         addr, client, producer, method='listMethods', timeout=DEFAULT_TIMEOUT, verify=False,
-        cert=None):
+        cert=None, session=None):
     """Get X-Road listMethods or allowedMethods response.
     Return tuple: (xRoadInstance, memberClass, memberCode,
     subsystemCode, serviceCode).
+    Optional requests.Session may be used for connection reuse.
     """
     url = addr
     # Add HTTP/HTTPS scheme if missing
@@ -472,7 +509,7 @@ def methods_rest(
     headers = {'X-Road-Client': client_header, 'accept': 'application/json'}
     methods_response = None
     try:
-        methods_response = requests.get(
+        methods_response = (session or requests).get(
             url, headers=headers, timeout=timeout, verify=verify, cert=cert)
         methods_response.raise_for_status()
         methods_response.encoding = 'utf-8'
@@ -489,8 +526,11 @@ def methods_rest(
         raise_rest_exception(err, methods_response)
 
 
-def wsdl(addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=None):
-    """Get X-Road getWsdl response."""
+def wsdl(
+        addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=None, session=None):
+    """Get X-Road getWsdl response.
+    Optional requests.Session may be used for connection reuse.
+    """
     url = addr
     # Add HTTP/HTTPS scheme if missing
     if not urlparse.urlsplit(url).scheme and (verify or cert):
@@ -519,19 +559,15 @@ def wsdl(addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=None
 
     headers = {'content-type': 'text/xml'}
     try:
-        wsdl_response = requests.post(
+        wsdl_response = (session or requests).post(
             url, data=data.encode('utf-8'), headers=headers, timeout=timeout, verify=verify,
             cert=cert)
         wsdl_response.raise_for_status()
         wsdl_response.encoding = 'utf-8'
 
-        resp = re.search(
-            '--xroad.+content-type:text/xml.+<SOAP-ENV:Envelope.+</SOAP-ENV:Envelope>'
-            '.+--xroad.+content-type:text/xml.*?\r\n\r\n(.+)\r\n--xroad.+',
-            wsdl_response.text, re.DOTALL)
+        resp = WSDL_MULTIPART_RE.search(wsdl_response.text)
         if resp:
-            envel = re.search(
-                '<SOAP-ENV:Envelope.+</SOAP-ENV:Envelope>', resp.group(1), re.DOTALL)
+            envel = SOAP_ENVELOPE_RE.search(resp.group(1))
             if envel:
                 # SOAP Fault found instead of WSDL
                 root = ElementTree.fromstring(envel.group(0))
@@ -540,8 +576,7 @@ def wsdl(addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=None
             else:
                 return resp.group(1)
 
-        envel = re.search(
-            '<SOAP-ENV:Envelope.+</SOAP-ENV:Envelope>', wsdl_response.text, re.DOTALL)
+        envel = SOAP_ENVELOPE_RE.search(wsdl_response.text)
         root = ElementTree.fromstring(envel.group(0))
         if root.find('.//faultstring') is not None:
             raise SoapFaultError(root.find('.//faultstring').text)
@@ -565,8 +600,11 @@ def wsdl_methods(wsdl_doc):
         raise XrdInfoError(err)
 
 
-def openapi(addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=None):
-    """Get X-Road getOpenAPI response."""
+def openapi(
+        addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=None, session=None):
+    """Get X-Road getOpenAPI response.
+    Optional requests.Session may be used for connection reuse.
+    """
     url = addr
     # Add HTTP/HTTPS scheme if missing
     if not urlparse.urlsplit(url).scheme and (verify or cert):
@@ -587,7 +625,7 @@ def openapi(addr, client, service, timeout=DEFAULT_TIMEOUT, verify=False, cert=N
     headers = {'X-Road-Client': client_header, 'accept': 'application/json'}
     openapi_response = None
     try:
-        openapi_response = requests.get(
+        openapi_response = (session or requests).get(
             url, headers=headers, timeout=timeout, verify=verify, cert=cert)
         openapi_response.raise_for_status()
         openapi_response.encoding = 'utf-8'
@@ -608,15 +646,18 @@ def load_openapi(openapi_doc):
         return data, 'json'
     except json.JSONDecodeError:
         try:
-            data = yaml.load(openapi_doc, Loader=yaml.SafeLoader)
+            data = yaml.load(openapi_doc, Loader=YAML_LOADER)
             return data, 'yaml'
         except yaml.YAMLError:
             raise XrdInfoError('Can not parse OpenAPI description')
 
 
-def openapi_endpoints(openapi_doc):
-    """Return list of endpoints in OpenAPI."""
-    data, _ = load_openapi(openapi_doc)
+def openapi_endpoints(openapi_doc, data=None):
+    """Return list of endpoints in OpenAPI.
+    Already loaded OpenAPI data may be provided to avoid parsing the document again.
+    """
+    if data is None:
+        data, _ = load_openapi(openapi_doc)
 
     results = []
     try: